@@ -0,0 +1,724 @@
+# Проверки правил и форматов "main 1.py". Запуск: python -m pytest -q
+import asyncio
+import copy
+import importlib.util
+import io
+import json
+import pickle
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Имя файла с пробелом не импортируется обычным import, поэтому модуль загружается по пути.
+MODULE_PATH = Path(__file__).resolve().parent.parent / "main 1.py"
+spec = importlib.util.spec_from_file_location("chess_main", MODULE_PATH)
+chess = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = chess
+spec.loader.exec_module(chess)
+
+Color = chess.Color
+BOARD_CLASSES = list(chess.BOARD_CLASSES.values())
+
+def playout(game_type, board_class, seed, plies=80):
+    """
+    Случайная партия.
+
+    :param game_type: Название игры.
+    :param board_class: Класс доски.
+    :param seed: Зерно.
+    :param plies: Наибольшее число полуходов.
+    :return: Пара (партия, список FEN после каждого полухода, начиная с начальной позиции).
+    """
+    rng = random.Random(seed)
+    game = chess.Game(game_type, board_class)
+    fens = [game.to_fen()]
+    while len(game.history) < plies and not game.outcome():
+        game.play_move(*rng.choice(list(game.board.generate_legal_moves(game.turn))))
+        fens.append(game.to_fen())
+    return game, fens
+
+def positions(board_class, count=6, plies=60):
+    """
+    Позиции из случайных партий всех игр.
+
+    :return: Генератор досок.
+    """
+    for game_type in chess.GAME_TYPES:
+        for seed in range(count):
+            _, fens = playout(game_type, chess.ArrayBoard, seed, plies)
+            for fen in fens[::7]:
+                yield chess.Game.from_fen(fen, board_class).board
+
+# perft ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_perft_reference(board_class):
+    assert chess.check_perft(board_class, max_nodes=30000) == []
+
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_perft_backends_agree_on_loaded_positions(board_class):
+    for board in positions(chess.ArrayBoard, count=2):
+        color = Color.WHITE
+        expected = chess.perft(chess.Board(board.game_type, board.codes()), color, 2)
+        assert chess.perft(board_class(board.game_type, board.codes()), color, 2) == expected
+
+# Генерация ходов против is_move_correct --------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_generated_moves_match_is_move_correct(board_class):
+    for board in positions(board_class):
+        for color in Color:
+            probed = set()
+            for x, y in chess.CORDS:
+                piece = board.get_piece(x, y)
+                if piece and piece.color == color:
+                    probed.update(((x, y), final) for final in chess.CORDS
+                                  if piece.is_move_correct((x, y), final, board))
+            generated = list(board.generate_moves(color))
+            assert len(generated) == len(set(generated))
+            assert set(generated) == probed
+
+# FEN --------------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_fen_round_trip(board_class):
+    for game_type in chess.GAME_TYPES:
+        game, fens = playout(game_type, board_class, seed=1)
+        for fen in fens:
+            loaded = chess.Game.from_fen(fen, board_class)
+            assert loaded.to_fen() == fen
+        assert loaded.board.codes() == game.board.codes()
+        assert loaded.board.key == game.board.key
+
+def test_fen_errors():
+    for text in ("8/8/8/8/8/8/8/8 w 0", "8/8/8/8/8/8/8/8 x 0 1", "9/8/8/8/8/8/8/8 w 0 1", "8/8/8/8/8/8/8/8 w 0 1 go"):
+        with pytest.raises(chess.FenError):
+            chess.Game.from_fen(text)
+
+# Запись ходов -----------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("text, error", [
+    ("z9z9", chess.NotationError), ("hello", chess.NotationError), ("Zf3", chess.NotationError),
+    ("e2e4=Z", chess.NotationError), ("Nf4", chess.IllegalMoveError), ("exd3", chess.IllegalMoveError),
+    ("e2:e4:e6", chess.IllegalMoveError), ("e2e5", chess.IllegalMoveError), ("e2e4=Q", chess.IllegalMoveError),
+    ("e7e5", chess.IllegalMoveError),
+])
+def test_move_errors(text, error):
+    game = chess.Game("chess", chess.ArrayBoard)
+    with pytest.raises(error) as raised:
+        game.apply_move(text)
+    assert isinstance(raised.value, chess.MoveError) and isinstance(raised.value, ValueError)
+    assert len(game.history) == 0 and game.to_fen() == chess.Game("chess").to_fen()
+
+def test_parse_move_short_and_ambiguous():
+    board = chess.Game.from_fen("k7/8/8/8/8/8/8/1N3N1K w 0 1 chess", chess.ArrayBoard).board
+    with pytest.raises(chess.AmbiguousMoveError):
+        chess.parse_move("Nd2", board, Color.WHITE)
+    assert chess.parse_move("Nbd2", board, Color.WHITE) == ((7, 1), (6, 3), None, None)
+    assert chess.parse_move("Nfd2+", board, Color.WHITE) == ((7, 5), (6, 3), None, None)
+    with pytest.raises(chess.AmbiguousMoveError): # Оба коня на первой строке
+        chess.parse_move("N1d2", board, Color.WHITE)
+    assert chess.parse_move("b1 d2", board, Color.WHITE) == ((7, 1), (6, 3), None, None)
+    assert chess.parse_move("B1-D2", board, Color.WHITE) == ((7, 1), (6, 3), None, None)
+
+def test_parse_move_capture_chain():
+    board = chess.ArrayBoard("checkers", bytes(64))
+    board.set_piece(6, 3, chess.Checker(Color.WHITE))
+    for square in ((5, 2), (3, 2), (5, 4), (3, 4), (0, 7)):
+        board.set_piece(*square, chess.Checker(Color.BLACK))
+    assert chess.parse_move("d2:b4:d6", board, Color.WHITE) == ((6, 3), (2, 3), ((5, 2), (3, 2)), None)
+    assert chess.parse_move("d2xf4xd6", board, Color.WHITE) == ((6, 3), (2, 3), ((5, 4), (3, 4)), None)
+    with pytest.raises(chess.IllegalMoveError):
+        chess.parse_move("d2:b4:b6", board, Color.WHITE)
+
+def test_apply_moves_reports_failing_index():
+    game = chess.Game("chess", chess.ArrayBoard)
+    with pytest.raises(chess.IllegalMoveError) as raised:
+        game.apply_moves(["e2e4", ((1, 4), (3, 4)), "Nf3", "e4e6"])
+    assert raised.value.index == 3 and len(game.history) == 3 # Ходы до ошибки остаются сделанными
+
+# Шашки ------------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_checkers_mandatory_capture(board_class):
+    game = chess.Game.from_fen("8/8/8/8/3c4/4C3/8/W7 w 0 1 checkers", board_class) # Шашка e3 бьет d4
+    assert chess.Checker.capture_required(Color.WHITE, game.board)
+    assert sorted(game.board.generate_legal_moves(Color.WHITE)) == [((5, 4), (3, 2))]
+    with pytest.raises(chess.IllegalMoveError):
+        game.apply_move("a1 b2") # Дамке тоже нельзя тихо ходить, пока шашка может бить
+
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_checkers_king_takes_like_bishop(board_class):
+    # Дамка не прыгает: b3-d5 берет шашку на d5, а прыжка b3:e6 нет, и бить она не обязана
+    game = chess.Game.from_fen("8/8/8/3c4/8/1W6/8/8 w 0 1 checkers", board_class)
+    assert not chess.Checker.capture_required(Color.WHITE, game.board)
+    moves = set(game.board.generate_legal_moves(Color.WHITE))
+    assert ((5, 1), (3, 3)) in moves and ((5, 1), (2, 4)) not in moves and ((5, 1), (6, 0)) in moves
+    game.apply_move("b3d5")
+    assert game.board.codes().count(chess.PIECE_CODES[chess.Checker, Color.BLACK]) == 0
+
+# Отмена и повтор ходов --------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_undo_redo_restore_key_and_position_counts(board_class):
+    for game_type in chess.GAME_TYPES:
+        rng = random.Random(game_type)
+        game = chess.Game(game_type, board_class)
+        states = []
+        while len(game.history) < 40 and not game.outcome():
+            states.append((game.board.key, game.board.codes(), dict(game.position_counts), game.turn, game.halfmove_clock))
+            game.play_move(*rng.choice(list(game.board.generate_legal_moves(game.turn))))
+        final = (game.board.key, game.board.codes(), dict(game.position_counts), game.turn, game.halfmove_clock)
+        for back in (1, 5, len(states)):
+            game.undo_move(back)
+            key, codes, counts, turn, clock = states[-back]
+            assert (game.board.key, game.board.codes(), game.position_counts, game.turn, game.halfmove_clock) == \
+                   (key, codes, counts, turn, clock)
+            assert game.board.key == game.board.compute_key()
+            game.redo_move(back)
+            assert (game.board.key, game.board.codes(), game.position_counts, game.turn, game.halfmove_clock) == final
+
+# Архив партий -----------------------------------------------------------------------------------------------------------------
+def test_archive_seek_round_trip(tmp_path):
+    path = tmp_path / "games.arc"
+    games = []
+    with chess.GameArchiveWriter(path, step=4) as writer:
+        for game_type in chess.GAME_TYPES:
+            for seed in range(4):
+                rng = random.Random(seed)
+                board = chess.ArrayBoard(game_type)
+                moves, boards, turn = [], [board.codes()], Color.WHITE
+                for _ in range(60):
+                    legal = list(board.generate_legal_moves(turn))
+                    if not legal:
+                        break
+                    start, final = rng.choice(legal)
+                    chains = chess.jump_chains_to(board, start, final)
+                    jumped = rng.choice(chains) if chains else None # Любая из цепочек, не только первая
+                    board.move_piece(start, final, jumped)
+                    moves.append((start, final, jumped) if jumped else (start, final))
+                    boards.append(board.codes())
+                    turn = turn.opposite()
+                writer.add_game(game_type, moves)
+                games.append((game_type, moves, boards))
+    with chess.GameArchive(path) as archive:
+        assert len(archive) == len(games)
+        for number, (game_type, moves, boards) in enumerate(games):
+            assert archive.info(number)["game_type"] == game_type
+            assert archive.moves(number) == [move[:2] for move in moves]
+            for ply, codes in enumerate(boards):
+                board, turn = archive.seek(number, ply)
+                assert board.codes() == codes
+                assert turn == (Color.WHITE if ply % 2 == 0 else Color.BLACK)
+
+def test_archive_keeps_capture_chain(tmp_path):
+    # Две цепочки взятий белой шашки с 6,3 на 2,3: через 5,2 и 3,2 или через 5,4 и 3,4
+    board = chess.ArrayBoard("checkers", bytes(64))
+    board.set_piece(6, 3, chess.Checker(Color.WHITE))
+    for square in ((5, 2), (3, 2), (5, 4), (3, 4), (0, 7)):
+        board.set_piece(*square, chess.Checker(Color.BLACK))
+    chains = chess.jump_chains_to(board, (6, 3), (2, 3))
+    assert len(chains) == 2
+    path = tmp_path / "chains.arc"
+    with chess.GameArchiveWriter(path, step=32) as writer:
+        for jumped in chains:
+            writer.add_game("checkers", [((6, 3), (2, 3), jumped)], board.codes())
+    with chess.GameArchive(path) as archive:
+        for number, jumped in enumerate(chains):
+            expected = chess.ArrayBoard("checkers", board.codes())
+            expected.move_piece((6, 3), (2, 3), jumped)
+            assert archive.seek(number, 1)[0].codes() == expected.codes()
+
+def test_archive_rejects_first_version(tmp_path):
+    path = tmp_path / "old.arc"
+    with chess.GameArchiveWriter(path) as writer:
+        writer.add_game("chess", [((6, 4), (4, 4))])
+    data = path.read_bytes()
+    assert data[:8] == chess.ARCHIVE_MAGIC
+    path.write_bytes(b"CHESSARC" + data[8:]) # Метка первой версии: ходы в ней читались бы иначе
+    with pytest.raises(ValueError):
+        chess.GameArchive(path)
+
+def test_archive_rejects_bad_step(tmp_path):
+    with pytest.raises(ValueError):
+        chess.GameArchiveWriter(tmp_path / "bad.arc", step=0)
+
+# Поиск хода ------------------------------------------------------------------------------------------------------------------
+MATE_IN_ONE = "7k/6pp/8/8/8/8/8/R5K1 w 0 1 chess" # Ra8#
+MATE_IN_TWO = "7k/8/8/8/8/8/R7/1R4K1 w 0 1 chess" # Две ладьи против короля
+
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("hash_mb", [None, 1])
+def test_engine_finds_forced_mate(board_class, hash_mb):
+    def engine():
+        return chess.Engine(time_limit=30, max_depth=6, tt=hash_mb and chess.TranspositionTable(hash_mb))
+    game = chess.Game.from_fen(MATE_IN_ONE, board_class)
+    search = engine()
+    assert search.search(game.board, game.turn) == ((7, 0), (0, 0))
+    assert search.score == chess.MATE - 1
+    game = chess.Game.from_fen(MATE_IN_TWO, board_class)
+    search = engine()
+    move = search.search(game.board, game.turn)
+    assert search.score == chess.MATE - 3
+    assert game.to_fen() == MATE_IN_TWO # Поиск вернул доску в исходное состояние
+    assert game.play_move(*move)
+    for reply in list(game.board.generate_legal_moves(game.turn)): # На любую защиту - мат следующим ходом
+        assert game.play_move(*reply)
+        assert game.play_move(*engine().search(game.board, game.turn))
+        assert game.outcome() == ("checkmate", Color.WHITE)
+        game.undo_move(2)
+
+def test_transposition_table_buckets():
+    tt = chess.TranspositionTable(1)
+    assert len(tt) * tt.ENTRY_BYTES == 1 << 20
+    first, second, third = (5 + n * (tt.mask + 1) for n in range(3)) # Три ключа одной корзины
+    assert tt.probe(first) is None
+    tt.store(first, 5, chess.EXACT, -chess.MATE + 3, ((6, 4), (4, 4)))
+    tt.store(second, 3, chess.LOWER, 17, None) # Мельче первой записи - во вторую
+    assert tt.probe(first) == (5, chess.EXACT, -chess.MATE + 3, ((6, 4), (4, 4)))
+    assert tt.probe(second) == (3, chess.LOWER, 17, None)
+    tt.store(third, 2, chess.UPPER, -40, ((0, 0), (7, 7))) # Вторая запись замещается всегда
+    assert tt.probe(second) is None
+    assert tt.probe(third) == (2, chess.UPPER, -40, ((0, 0), (7, 7)))
+    assert tt.probe(first)[0] == 5
+    tt.store(first, 1, chess.EXACT, 8, None) # Тот же ключ обновляется на месте при любой глубине
+    assert tt.probe(first) == (1, chess.EXACT, 8, None)
+    tt.store(second, 4, chess.EXACT, 9, None) # Глубже первой записи - на ее место
+    assert tt.probe(first) is None
+    assert tt.probe(second) == (4, chess.EXACT, 9, None)
+    stats = tt.stats()
+    assert (stats["stores"], stats["replaced"]) == (5, 2)
+    assert tt.collisions == 2 # Промахи по занятой корзине
+    tt.clear()
+    assert tt.probe(second) is None and tt.stats()["fill"] == 0
+
+def test_transposition_table_shared_buffer():
+    buffer = bytearray(1 << 20)
+    writer, reader = chess.TranspositionTable(1, buffer=buffer), chess.TranspositionTable(1, buffer=buffer)
+    writer.store(12345, 9, chess.EXACT, 250, ((1, 2), (3, 4)))
+    assert reader.probe(12345) == (9, chess.EXACT, 250, ((1, 2), (3, 4)))
+    writer.close()
+    reader.close()
+
+def test_parallel_engine_matches_serial():
+    engine = chess.ParallelEngine(workers=2, hash_mb=4)
+    try:
+        for game_type in chess.GAME_TYPES:
+            game, _ = playout(game_type, chess.ArrayBoard, seed=3, plies=20)
+            serial = chess.Engine(time_limit=600, max_depth=3)
+            serial.search(game.board, game.turn)
+            engine.tt.clear()
+            move = engine.search(game.board, game.turn, time_limit=600, max_depth=3)
+            assert serial.depth == 3
+            assert (engine.depth, engine.score) == (serial.depth, serial.score)
+            assert move in list(game.board.generate_legal_moves(game.turn))
+        game = chess.Game.from_fen(MATE_IN_ONE, chess.ArrayBoard)
+        assert engine.search(game.board, game.turn, time_limit=600, max_depth=3) == ((7, 0), (0, 0))
+        assert engine.score == chess.MATE - 1
+    finally:
+        engine.close()
+
+# Пакетная оценка --------------------------------------------------------------------------------------------------------------
+def batch_positions():
+    rng = random.Random(15)
+    codes = [board.codes() for board in positions(chess.ArrayBoard, count=4)]
+    for _ in range(200): # Случайные расстановки, в том числе с несколькими королями одного цвета
+        codes.append(bytes(rng.choice([0] * 6 + list(range(1, len(chess.PIECES)))) for _ in range(64)))
+    return codes
+
+EVALUATORS = [chess.Evaluator(), chess.Evaluator(mobility=0, king_shield=7, squares={}),
+              chess.Evaluator(values={piece_type: 1 for piece_type in chess.PIECE_TYPES}, mobility=-3)]
+
+@pytest.mark.parametrize("evaluator", EVALUATORS, ids=["default", "shield", "mobility"])
+def test_evaluate_batch_matches_scalar(evaluator):
+    np = pytest.importorskip("numpy")
+    codes = batch_positions()
+    packed = np.frombuffer(b"".join(codes), dtype=np.int8).reshape(-1, 64)
+    for color in Color:
+        expected = [evaluator.evaluate_codes(position, color) for position in codes]
+        assert evaluator.evaluate_batch(packed, color, chunk=100).tolist() == expected
+    boards = [chess.ArrayBoard(chess.guess_game_type(position), position) for position in codes[:50]]
+    assert evaluator.evaluate_batch(boards).tolist() == [evaluator(board, Color.WHITE) for board in boards]
+
+def test_evaluate_batch_without_numpy(monkeypatch):
+    monkeypatch.setattr(chess, "np", None)
+    evaluator = chess.Evaluator()
+    codes = batch_positions()[:60]
+    assert evaluator.evaluate_batch(codes, Color.BLACK) == [evaluator.evaluate_codes(position, Color.BLACK) for position in codes]
+
+# Конец партии ----------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("fen, outcome, check", [
+    ("R6k/6pp/8/8/8/8/8/6K1 b 0 1 chess", ("checkmate", Color.WHITE), True),
+    ("k7/8/1Q6/8/8/8/8/7K b 0 1 chess", ("stalemate", None), False),
+    ("R6k/8/8/8/8/8/8/6K1 b 0 1 chess", None, True), # Шах, но король уходит
+    ("8/8/8/8/8/2c5/1c6/C7 w 0 1 checkers", ("no_moves", Color.BLACK), False),
+])
+def test_outcome(board_class, fen, outcome, check):
+    game = chess.Game.from_fen(fen, board_class)
+    assert game.board.is_in_check(game.turn) == check
+    assert game.outcome() == outcome
+
+# Отрисовка --------------------------------------------------------------------------------------------------------------------
+def terminal_screen(text):
+    """
+    Экран терминала после вывода: понимает перевод строки и escape-последовательности AnsiRenderer.
+
+    :return: Список строк экрана без пробелов в конце.
+    """
+    screen, row, column = {}, 0, 0
+    for part in re.split(r"(\x1b\[[0-9;]*[HJ]|\n)", text):
+        if part == "\n":
+            row, column = row + 1, 0
+        elif part.startswith("\x1b["):
+            if part.endswith("H"):
+                numbers = [int(number) for number in part[2:-1].split(";") if number]
+                row, column = (numbers[0] - 1, numbers[1] - 1) if numbers else (0, 0)
+            else: # "\x1b[2J" - весь экран, "\x1b[J" - от курсора до конца
+                screen = {} if part == "\x1b[2J" else {(r, c): char for (r, c), char in screen.items()
+                                                         if (r, c) < (row, column)}
+        else:
+            for char in part:
+                screen[row, column] = char
+                column += 1
+    rows = max((r for r, _ in screen), default=-1) + 1
+    return ["".join(screen.get((r, c), " ") for c in range(max(c for _, c in screen) + 1)).rstrip()
+            for r in range(rows)]
+
+def test_ansi_renderer_keeps_messages_after_redraw(monkeypatch, capsys):
+    game = chess.Game("chess", chess.ArrayBoard)
+    game.renderer = chess.AnsiRenderer()
+    game.engine = chess.Engine(time_limit=0.05, max_depth=1) # Только для подсказки: engine_color не задан
+    answers = iter(["e2e5", "?", "e2e4"])
+    output, screens = "", [] # Экран в момент каждого запроса ввода
+    def fake_input(prompt):
+        nonlocal output
+        print(prompt, end="")
+        output += capsys.readouterr().out
+        screens.append(terminal_screen(output))
+        answer = next(answers, None)
+        if answer is None:
+            raise EOFError
+        print(answer) # Эхо ввода в терминале
+        return answer
+    monkeypatch.setattr("builtins.input", fake_input)
+    with pytest.raises(EOFError):
+        game.playing()
+    first, after_error, after_hint, after_move = screens
+    def shown(screen, start):
+        return any(line.startswith(start) for line in screen)
+    assert first[2] == "8  r n b k q b n r 8" and first[9] == "1  R N B K Q B N R 1"
+    assert shown(after_error, "Такой ход невозможен (e2-e5") # Ошибка пережила перерисовку
+    assert shown(after_hint, "Подсказка: ") and not shown(after_hint, "Такой ход") # Новое сообщение сменило старое
+    assert not shown(after_move, "Подсказка") and shown(after_move, "Ходят черные!")
+    assert after_move[6] == "4  . . . . P . . . 4" and after_move[8] == "2  P P P P . P P P 2"
+
+def test_text_renderer_skips_repeated_frames():
+    output = io.StringIO()
+    renderer = chess.TextRenderer(output)
+    board = chess.ArrayBoard("checkers")
+    renderer.draw(board)
+    renderer.draw(board)
+    renderer.message("сообщение")
+    assert output.getvalue() == chess.render_board(board.codes()) + "сообщение\n"
+
+# Массовые партии --------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("game_type", chess.GAME_TYPES)
+def test_simulate_games_same_in_parallel(game_type):
+    policies = (chess.RandomPolicy(), chess.GreedyCapturePolicy())
+    serial = list(chess.simulate_games(game_type, 6, *policies, seed=7, workers=1, max_plies=60))
+    parallel = sorted(chess.simulate_games(game_type, 6, *policies, seed=7, workers=2, max_plies=60),
+                      key=lambda result: result["index"])
+    assert serial == parallel
+    assert [result["index"] for result in serial] == list(range(6))
+    for result in serial: # Партия повторяется по ходам из результата
+        game = chess.Game(game_type, chess.ArrayBoard)
+        game.max_plies = 60
+        assert game.apply_moves(result["moves"]) == result["plies"]
+        assert game.outcome()[0] == result["outcome"]
+
+def test_scripted_policy_resigns_after_script():
+    script = chess.ScriptedPolicy(["e2 e4", "g1 f3"])
+    result = chess.play_game("chess", script, chess.RandomPolicy(), seed=1)
+    assert result["moves"][0::2] == ["e2 e4", "g1 f3"]
+    assert (result["outcome"], result["winner"], result["plies"]) == ("resign", "black", 4)
+
+# Протокол UCI ------------------------------------------------------------------------------------------------------------------
+def test_uci_script():
+    output = io.StringIO()
+    session = chess.UciSession(output=output, board_class=chess.ArrayBoard)
+    session.run(io.StringIO("\n".join([
+        "uci", "isready", "setoption name UCI_Variant value checkers", "position startpos moves c3d4 f6e5",
+        "go depth 2", "position startpos moves c3c4", "frobnicate", "quit", "go depth 1"])))
+    lines = output.getvalue().splitlines()
+    assert lines[0] == "id name Chess" and "uciok" in lines and "readyok" in lines
+    assert "info string illegal move c3c4" in lines and "info string unknown command frobnicate" in lines
+    bestmoves = [line.split()[1] for line in lines if line.startswith("bestmove")]
+    assert len(bestmoves) == 1 # После quit команды не выполняются
+    game = chess.Game("checkers", chess.ArrayBoard)
+    game.apply_moves(["c3d4", "f6e5"])
+    start, final = chess.parse_square(bestmoves[0][:2]), chess.parse_square(bestmoves[0][2:])
+    assert (start, final) in set(game.board.generate_legal_moves(game.turn))
+    assert any(line.startswith("info depth 2 ") for line in lines)
+
+def held_search(session, output, command):
+    session.command("position fen " + MATE_IN_ONE)
+    session.command(command)
+    deadline = time.monotonic() + 30
+    while "info depth" not in output.getvalue(): # Мат в один ход поиск находит сразу
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert "bestmove" not in output.getvalue()
+
+@pytest.mark.parametrize("command, release", [("go infinite", "stop"), ("go ponder", "ponderhit"),
+                                              ("go infinite", "position startpos")])
+def test_uci_holds_bestmove_until_released(command, release):
+    output = io.StringIO()
+    session = chess.UciSession(output=output, board_class=chess.ArrayBoard)
+    held_search(session, output, command)
+    session.command("isready") # Отвечает и во время поиска
+    assert output.getvalue().splitlines()[-1] == "readyok"
+    session.command(release)
+    session.wait()
+    assert output.getvalue().count("bestmove a1a8") == 1
+    session.command("quit")
+
+# Сервер партий ----------------------------------------------------------------------------------------------------------------
+def test_board_diff():
+    game = chess.Game("chess", chess.ArrayBoard)
+    before = game.board.codes()
+    game.apply_move("e2e4")
+    assert chess.board_diff(before, game.board.codes()) == "e4=P e2=."
+
+def test_game_server_broadcasts_diffs():
+    async def scenario():
+        server = chess.GameServer()
+        listener = await server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        clients = [await asyncio.open_connection("127.0.0.1", port) for _ in range(3)]
+        async def say(number, line):
+            clients[number][1].write((line + "\n").encode("ascii"))
+            return await hear(number)
+        async def hear(number):
+            return (await asyncio.wait_for(clients[number][0].readline(), 30)).decode("ascii").rstrip("\n")
+        white, black, late = 0, 1, 2
+        created = (await say(white, "new chess")).split()
+        game_id = created[1]
+        assert created[0] == "game" and " ".join(created[2:]) == chess.Game("chess").to_fen()
+        assert await say(black, "join " + game_id) == "state %s %s" % (game_id, " ".join(created[2:]))
+        diff = "diff %s 1 b e4=P e2=." % game_id
+        assert await say(white, "move %s e2e4" % game_id) == diff
+        assert await hear(black) == diff # Ход рассылается всем, кто следит за партией
+        assert await say(black, "move %s e7e4" % game_id) == "error %s illegal move e7e4" % game_id
+        moves = (await say(black, "moves " + game_id)).split()
+        assert moves[:2] == ["moves", game_id] and len(moves) - 2 == 20
+        assert await say(late, "move 999 e2e4") == "error 999 unknown game id"
+        # Позиция с матом в один ход: после него партия закрывается для ходов
+        server.games[game_id] = chess.Game.from_fen(MATE_IN_ONE, chess.ArrayBoard)
+        mate = ["diff %s 1 b a8=R a1=." % game_id, "end %s checkmate white" % game_id]
+        assert [await say(white, "move %s a1a8" % game_id), await hear(white)] == mate
+        assert [await hear(black), await hear(black)] == mate
+        assert await say(white, "move %s g1g2" % game_id) == "error %s game over" % game_id
+        assert (await say(late, "join " + game_id)).startswith("state %s R6k/" % game_id)
+        assert await hear(late) == mate[1]
+        for reader, writer in clients: # Партия удаляется, когда за ней никто не следит
+            writer.close()
+            await writer.wait_closed()
+        for _ in range(100):
+            if not server.games:
+                break
+            await asyncio.sleep(0.01)
+        assert server.games == {} and server.watchers == {} and server.results == {}
+        listener.close()
+        await listener.wait_closed()
+    asyncio.run(scenario())
+
+# Дебютная книга ---------------------------------------------------------------------------------------------------------------
+def test_opening_book(tmp_path):
+    def moves(*names):
+        return [(chess.parse_square(name[:2]), chess.parse_square(name[2:])) for name in names]
+    archive = tmp_path / "games.arc"
+    with chess.GameArchiveWriter(archive) as writer:
+        for _ in range(3):
+            writer.add_game("chess", moves("e2e4", "e7e5", "g1f3"))
+        writer.add_game("chess", moves("d2d4", "d7d5"))
+        writer.add_game("checkers", moves("c3d4")) # Другая игра в книгу не попадает
+    assert chess.build_book(archive, tmp_path / "all.book", "chess", max_plies=2) == 4
+    with chess.OpeningBook(tmp_path / "all.book") as book:
+        assert book.game_type == "chess" and len(book) == 4
+        game = chess.Game("chess", chess.ArrayBoard)
+        assert book.probe(chess.position_key(game.board, game.turn)) == [(moves("e2e4")[0], 3), (moves("d2d4")[0], 1)]
+        game.book = book
+        assert game.book_move() == "e2 e4"
+        assert game.suggest_move() == "e2 e4" # Книга - раньше перебора
+        rng = random.Random(1)
+        assert {book.choose(game.board, game.turn, rng) for _ in range(40)} == set(moves("e2e4", "d2d4"))
+        game.apply_move("e2e4")
+        assert game.book_move() == "e7 e5"
+        game.apply_move("e7e5")
+        assert game.book_move() is None # Третий полуход за пределами max_plies
+        checkers = chess.Game("checkers")
+        checkers.book = book
+        assert checkers.book_move() is None # Книга другой игры не используется
+    assert chess.build_book(archive, tmp_path / "common.book", "chess", max_plies=2, min_count=2) == 2
+    with chess.OpeningBook(tmp_path / "common.book") as book:
+        assert book.probe(chess.position_key(chess.ArrayBoard("chess"), Color.WHITE)) == [(moves("e2e4")[0], 3)]
+    with pytest.raises(ValueError):
+        chess.OpeningBook(archive)
+
+# Ничьи ------------------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("board_class", BOARD_CLASSES, ids=lambda cls: cls.__name__)
+def test_threefold_repetition(board_class):
+    game = chess.Game("chess", board_class)
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+    game.apply_moves(shuffle + shuffle[:3])
+    assert game.outcome() is None
+    game.apply_move(shuffle[3]) # Начальная позиция в третий раз
+    assert game.outcome() == ("repetition", None)
+    game.undo_move(1)
+    assert game.outcome() is None
+    game.redo_move(1)
+    assert game.outcome() == ("repetition", None)
+    game.repetition_limit = 4
+    assert game.outcome() is None
+
+def test_fifty_move_rule():
+    game = chess.Game.from_fen("k7/8/8/8/8/8/P7/R6K w 99 60 chess", chess.ArrayBoard)
+    game.apply_move("a2a3") # Ход пешкой обнуляет счетчик
+    assert game.halfmove_clock == 0 and game.outcome() is None
+    game = chess.Game.from_fen("k7/8/8/8/8/8/P7/R6K w 99 60 chess", chess.ArrayBoard)
+    game.apply_move("h1g1")
+    assert game.halfmove_clock == 100 and game.outcome() == ("fifty_moves", None)
+    game.undo_move(1)
+    assert game.halfmove_clock == 99 and game.outcome() is None
+    mate = chess.Game.from_fen(MATE_IN_ONE.replace(" 0 1 ", " 99 60 "), chess.ArrayBoard)
+    mate.apply_move("a1a8") # Мат сотым полуходом - мат, а не ничья
+    assert mate.outcome() == ("checkmate", Color.WHITE)
+
+def test_max_plies():
+    game = chess.Game("chess", chess.ArrayBoard)
+    game.max_plies = 4
+    game.apply_moves(["e2e4", "e7e5", "g1f3"])
+    assert game.outcome() is None
+    game.apply_move("b8c6")
+    assert game.outcome() == ("max_plies", None)
+
+# Таблицы эндшпиля -------------------------------------------------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("tablebases")
+    chess.build_tablebases(["CvW", "CvC"], str(directory), workers=1)
+    with chess.Tablebase(str(directory)) as tables:
+        yield tables
+
+def test_tablebase_same_in_processes(tablebase, tmp_path):
+    directory = Path(tablebase.directory)
+    for name in chess.tablebase_dependencies("CvC"): # Нужны в каталоге новой таблицы
+        (tmp_path / (name + ".tb")).write_bytes((directory / (name + ".tb")).read_bytes())
+    built = chess.build_tablebase("CvC", str(tmp_path), workers=2, chunk=1000)
+    assert Path(built).read_bytes() == (directory / "CvC.tb").read_bytes()
+
+@pytest.mark.parametrize("name", ["CvW", "CvC"])
+def test_tablebase_best_move_length_matches_probe(tablebase, name):
+    material = chess.Material(name)
+    rng = random.Random(name)
+    checked = 0
+    for index in rng.sample(range(material.size), 400):
+        squares, black = material.decode(index)
+        if len(set(squares)) < len(squares):
+            continue
+        codes = bytearray(64)
+        for code, square in zip(material.codes, squares):
+            codes[square] = code
+        board = chess.ArrayBoard("checkers", bytes(codes))
+        color = Color.BLACK if black else Color.WHITE
+        outcome, plies = tablebase.probe(board, color)
+        if outcome == "draw":
+            continue
+        for played in range(plies):
+            move = tablebase.best_move(board, color)
+            assert move is not None
+            board.move_piece(*move)
+            color = color.opposite()
+            assert tablebase.probe(board, color) == ("win" if (plies - played - 1) % 2 else "loss", plies - played - 1)
+        assert not list(board.generate_legal_moves(color)) # Проигравшей стороне нечем ходить
+        checked += 1
+    assert checked
+
+# Счетчики Stats ---------------------------------------------------------------------------------------------------------------
+def patched_methods():
+    owners = chess.PIECE_TYPES + (chess.Board, chess.ArrayBoard, chess.TextRenderer, chess.AnsiRenderer, chess.NullRenderer)
+    return {(owner, name): owner.__dict__.get(name) for owner in owners
+            for name in ("is_move_correct", "get_piece", "snapshot", "move_piece", "unmake_move", "show_board", "draw")}
+
+def test_stats_counts_only_while_enabled():
+    game = chess.Game("chess", chess.ArrayBoard)
+    with chess.Stats() as stats:
+        game.apply_moves(["e2e4", "e7e5", "g1f3"])
+        game.undo_move(1)
+    game.apply_moves(["g1f3", "b8c6"]) # После выключения не считается
+    counters = stats.report()["counters"]
+    assert counters["move"]["calls"] == 3 and counters["move"]["bytes"] > 0
+    assert counters["undo"]["calls"] == 1
+    assert counters["is_move_correct.Pawn"]["calls"] == 2 and counters["is_move_correct.Knight"]["calls"] == 1
+    assert "is_move_correct.Queen" not in counters
+    stats.enable()
+    game.apply_move("f1c4")
+    stats.disable()
+    assert stats.report()["counters"]["move"]["calls"] == 4 # Повторное включение продолжает счетчики
+
+def test_stats_restores_methods():
+    before = patched_methods()
+    with pytest.raises(ValueError):
+        with chess.Stats():
+            assert patched_methods() != before
+            raise ValueError
+    assert patched_methods() == before
+    assert "get_piece" not in chess.BitBoard.__dict__ # Унаследованный метод не остается в подклассе
+    assert chess.Stats._active is None
+
+def test_stats_single_active():
+    first, second = chess.Stats(), chess.Stats()
+    with first:
+        assert first.enable() is first
+        with pytest.raises(RuntimeError):
+            second.enable()
+    with second: # После выключения первого второй включается
+        pass
+
+def test_stats_dump_and_log(tmp_path):
+    output = io.StringIO()
+    with chess.Stats() as stats:
+        stats.start_log(0.01, output)
+        chess.Game("chess", chess.ArrayBoard).apply_moves(["e2e4", "e7e5"])
+        time.sleep(0.05)
+        thread = stats.logging[1]
+    assert stats.logging is None and not thread.is_alive() # disable дожидается потока лога
+    lines = output.getvalue().splitlines()
+    assert lines and all(line.startswith("stats ") for line in lines)
+    stats.dump(tmp_path / "stats.json")
+    report = json.loads((tmp_path / "stats.json").read_text(encoding="utf-8"))
+    assert report["counters"]["move"]["calls"] == 2
+
+# Фигуры-одиночки --------------------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("piece_type", chess.PIECE_TYPES, ids=lambda cls: cls.__name__)
+def test_piece_interned_and_immutable(piece_type):
+    piece = piece_type(Color.WHITE)
+    assert piece is piece_type(Color.WHITE) is chess.PIECES[chess.PIECE_CODES[piece_type, Color.WHITE]]
+    assert piece is not piece_type(Color.BLACK)
+    assert copy.copy(piece) is piece and copy.deepcopy(piece) is piece
+    assert pickle.loads(pickle.dumps(piece)) is piece
+    assert not hasattr(piece, "__dict__") # У подкласса объявлены __slots__ = ()
+    with pytest.raises(AttributeError):
+        piece.color = Color.BLACK
+    with pytest.raises(AttributeError):
+        del piece.table
+    with pytest.raises(AttributeError):
+        piece.extra = 1
+    assert piece.color == Color.WHITE
+
+def test_board_copies_share_pieces():
+    board = chess.Board("chess")
+    for other in (copy.deepcopy(board), pickle.loads(pickle.dumps(board))):
+        for x in range(8):
+            for y in range(8):
+                assert other.get_piece(x, y) is board.get_piece(x, y)